@@ -0,0 +1,137 @@
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def accepted_encodings(accept_encoding):
+    """Parses an Accept-Encoding header into a dict of quality values."""
+    encodings = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        encodings[name] = quality
+    return encodings
+
+
+def choose_encoding(accept_encoding, preferred):
+    """Chooses a content encoding supported by both client and server.
+
+    Args:
+        accept_encoding: The Accept-Encoding request header.
+        preferred: The server encodings, most preferred first.
+
+    Returns:
+        The chosen encoding or None if the response should not be encoded.
+    """
+    accepted = accepted_encodings(accept_encoding or '')
+    best, best_quality = None, 0.0
+    for encoding in preferred:
+        if encoding == 'br' and brotli is None:
+            continue
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def gzip_stream(chunks, level):
+    """Compresses chunks with gzip, flushing after each chunk."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def brotli_stream(chunks, quality):
+    """Compresses chunks with brotli, flushing after each chunk."""
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in chunks:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+STREAMS = {
+    'br': (brotli_stream, 'COMPRESS_BROTLI_QUALITY'),
+    'gzip': (gzip_stream, 'COMPRESS_LEVEL'),
+}
+
+
+def compress_response(response, accept_encoding, config):
+    """Compresses a response according to the request Accept-Encoding.
+
+    Buffered and file responses smaller than COMPRESS_MIN_SIZE are left
+    alone, while streamed responses are compressed chunk by chunk so that
+    earlier parts of the page still reach the client before the rest is
+    rendered.
+
+    Args:
+        response: The response to compress.
+        accept_encoding: The Accept-Encoding request header.
+        config: The app config with the COMPRESS_* settings.
+
+    Returns:
+        The response.
+    """
+    if response.mimetype not in config['COMPRESS_MIMETYPES']:
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+
+    # The front-end server sends the file body, so it cannot be encoded here
+    if 'X-Sendfile' in response.headers:
+        return response
+
+    # Streamed responses have no length and are always worth compressing
+    if response.direct_passthrough:
+        size = response.content_length
+    elif not response.is_streamed:
+        size = len(response.get_data())
+    else:
+        size = None
+    if size is not None and size < config['COMPRESS_MIN_SIZE']:
+        return response
+
+    encoding = choose_encoding(accept_encoding, config['COMPRESS_ENCODINGS'])
+    if not encoding:
+        return response
+
+    compress, level_setting = STREAMS[encoding]
+    stream = compress(response.iter_encoded(), config[level_setting])
+    if response.is_streamed or response.direct_passthrough:
+        # Keep closing the original iterable, e.g. a static file wrapper
+        close = getattr(response.response, 'close', None)
+        if close is not None:
+            response.call_on_close(close)
+        response.response = stream
+        response.direct_passthrough = False
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(b''.join(stream))
+    response.headers['Content-Encoding'] = encoding
+
+    # The encoded body differs from the original, so only a weak ETag holds
+    etag, _ = response.get_etag()
+    if etag:
+        response.set_etag(etag, weak=True)
+
+    return response
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, event
+from sqlalchemy import Integer, create_engine, event, literal, select
 from sqlalchemy.orm import joinedload, sessionmaker
 
 from .models import *
@@ -44,6 +44,75 @@ def init(app, g):
     Base.metadata.create_all(engine)
 
 
+REASSIGN_MODES = ('copy', 'move', 'merge')
+
+
+def reassign_items(session, source_id, target_id, mode='move',
+                   item_ids=None):
+    """Reassigns items from one category to another in bulk.
+
+    The associations are rewritten with set-based INSERT ... SELECT and
+    DELETE statements within a single transaction, so no association objects
+    are loaded into the session.
+
+    Args:
+        session: The database session.
+        source_id: The ID of the category to take items from.
+        target_id: The ID of the category to add items to.
+        mode: 'copy' adds the items to the target category, 'move' also
+            removes them from the source category and 'merge' also deletes
+            the source category.
+        item_ids: Optionally restricts the reassignment to these item IDs.
+            Not allowed when merging.
+
+    Returns:
+        The number of associations added to the target category.
+    """
+    if mode not in REASSIGN_MODES:
+        raise ValueError('Unknown reassign mode: {}'.format(mode))
+    if source_id == target_id:
+        raise ValueError('Source and target categories must differ.')
+    if mode == 'merge' and item_ids is not None:
+        # Deleting the source would drop the associations left behind
+        raise ValueError('Merging always reassigns every item.')
+
+    assoc = CategoryItemAssociation.__table__
+    target = assoc.alias()
+
+    # Skip items already in the target category to respect the primary key
+    existing = select([target.c.item_id]) \
+        .where(target.c.category_id == target_id)
+
+    source = select([literal(target_id, Integer), assoc.c.item_id]) \
+        .where(assoc.c.category_id == source_id) \
+        .where(~assoc.c.item_id.in_(existing))
+    if item_ids is not None:
+        source = source.where(assoc.c.item_id.in_(item_ids))
+
+    try:
+        result = session.execute(
+            assoc.insert().from_select(['category_id', 'item_id'], source))
+        added = result.rowcount
+
+        if mode in ('move', 'merge'):
+            delete = assoc.delete().where(assoc.c.category_id == source_id)
+            if item_ids is not None:
+                delete = delete.where(assoc.c.item_id.in_(item_ids))
+            session.execute(delete)
+
+        if mode == 'merge':
+            categories = Category.__table__
+            session.execute(
+                categories.delete().where(categories.c.id == source_id))
+
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+    return added
+
+
 def load_sample_data(app, g, data):
     """Loads sample data into the database."""
     _, Session = get(app, g)
@@ -1,3 +1,4 @@
+import click
 import os
 import yaml
 
@@ -5,13 +6,16 @@ from urllib.parse import urlunsplit
 
 from flask import Flask
 from flask import g, render_template, redirect, request, session, url_for
-from flask import jsonify
+from flask import Response, jsonify, stream_with_context
 
 from oauth2client.client import FlowExchangeError, OAuth2WebServerFlow
 
 from sqlalchemy import desc
+from sqlalchemy.exc import IntegrityError
 
 from . import db
+from .compress import compress_response
+from .suggest import PrefixIndex
 
 
 def create_app():
@@ -26,6 +30,20 @@ def create_app():
         'PASSWORD': 'default',
         'GOOGLE_OAUTH_CLIENT_ID': '',
         'GOOGLE_OAUTH_CLIENT_SECRET': '',
+        'STREAM_BUFFER_SIZE': 16,
+        'SUGGEST_INDEX_MAX_AGE': 60,
+        'COMPRESS_ENCODINGS': ['br', 'gzip'],
+        'COMPRESS_LEVEL': 6,
+        'COMPRESS_BROTLI_QUALITY': 5,
+        'COMPRESS_MIN_SIZE': 500,
+        'COMPRESS_MIMETYPES': [
+            'application/javascript',
+            'application/json',
+            'image/svg+xml',
+            'text/css',
+            'text/html',
+            'text/plain',
+        ],
     })
     app.config.from_envvar('INVENTORY_SETTINGS', silent=True)
 
@@ -34,6 +52,11 @@ def create_app():
 
 app = create_app()
 
+# Title indexes for autocomplete, loaded on first use and reloaded
+# periodically to pick up writes from other processes
+category_index = PrefixIndex()
+item_index = PrefixIndex()
+
 
 def load_sample_data():
     """Loads sample data into the database."""
@@ -68,6 +91,70 @@ def initdb_command():
     print('Initialized the database.')
 
 
+@app.cli.command('reassign')
+@click.argument('source_id', type=int)
+@click.argument('target_id', type=int)
+@click.option('--mode', type=click.Choice(db.REASSIGN_MODES),
+              default='move', help='How to reassign the items.')
+def reassign_command(source_id, target_id, mode):
+    """Copies, moves or merges items between categories."""
+    if source_id == target_id:
+        raise click.BadParameter('must differ from the source category.',
+                                 param_hint='target_id')
+
+    _, Session = db.get(app, g)
+    sess = Session()
+
+    # Ensure both categories exist
+    query = sess.query(db.Category.id)
+    query = query.filter(db.Category.id.in_([source_id, target_id]))
+    found = set(id for id, in query)
+    for param, category_id in (('source_id', source_id),
+                               ('target_id', target_id)):
+        if category_id not in found:
+            raise click.BadParameter(
+                'category {} does not exist.'.format(category_id),
+                param_hint=param)
+
+    try:
+        added = db.reassign_items(sess, source_id, target_id, mode=mode)
+    except (ValueError, IntegrityError) as e:
+        raise click.ClickException(str(e))
+    print('Reassigned {} items.'.format(added))
+
+
+def get_index(index, model):
+    """Loads a title index from the database when missing or stale."""
+    if index.is_stale(app.config['SUGGEST_INDEX_MAX_AGE']):
+        _, Session = db.get(app, g)
+        index.load(lambda: Session().query(model.id, model.title))
+    return index
+
+
+def existing_category_ids(sess, category_ids):
+    """Filters out category IDs that no longer exist.
+
+    Suggestions may briefly include categories deleted by another process,
+    so those are skipped rather than failing the foreign key check.
+    """
+    category_ids = set(map(int, category_ids))
+    if not category_ids:
+        return category_ids
+    query = sess.query(db.Category.id)
+    query = query.filter(db.Category.id.in_(category_ids))
+    return set(id for id, in query)
+
+
+def suggest(index, model):
+    """Returns JSON suggestions for the `prefix` query parameter."""
+    prefix = request.args.get('prefix', '').strip()
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    if not prefix:
+        return []
+    matches = get_index(index, model).search(prefix, limit=limit)
+    return [{'id': id, 'title': title} for id, title in matches]
+
+
 @app.teardown_appcontext
 def close_db(error):
     """Closes the database again at the end of the request."""
@@ -75,6 +162,33 @@ def close_db(error):
         g.db_engine.dispose()
 
 
+@app.after_request
+def compress(response):
+    """Compresses the response if the client accepts it."""
+    return compress_response(response,
+                             request.headers.get('Accept-Encoding'),
+                             app.config)
+
+
+def stream_template(template_name, **context):
+    """Renders a template as a response streamed in chunks.
+
+    The page is sent as it renders, so the head and sidebar reach the client
+    before long item lists are complete. STREAM_BUFFER_SIZE sets how many
+    template fragments are grouped into each chunk.
+    """
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    stream = template.stream(context)
+    stream.enable_buffering(app.config['STREAM_BUFFER_SIZE'])
+    return Response(stream_with_context(stream))
+
+
+@app.errorhandler(400)
+def bad_request(error='Bad request.'):
+    return render_template('error.html', error=error), 400
+
+
 @app.errorhandler(404)
 def page_not_found(error='Not found.'):
     return render_template('error.html', error=error), 404
@@ -85,6 +199,11 @@ def unauthorized(error='Unauthorized.'):
     return render_template('error.html', error=error), 403
 
 
+@app.errorhandler(409)
+def conflict(error='Conflict.'):
+    return render_template('error.html', error=error), 409
+
+
 @app.errorhandler(FlowExchangeError)
 def oauth2_error(error):
     return render_template('error.html', error=error), 403
@@ -175,10 +294,9 @@ def list_items(format=None):
     session = Session()
 
     # Fetch items
-    query = session.query(db.Item).options(db.item_with_categories)
-    query = query.order_by(desc(db.Item.updated_at))
-    # query = query.limit(10)
-    items = query.all()
+    items = session.query(db.Item).options(db.item_with_categories)
+    items = items.order_by(desc(db.Item.updated_at))
+    # items = items.limit(10)
 
     # Return in JSON format
     if format == 'json':
@@ -189,11 +307,18 @@ def list_items(format=None):
     # query = query.limit(10)
     categories = query.all()
 
-    return render_template('index.html',
+    # Items are queried while the page streams, after the sidebar is sent
+    return stream_template('index.html',
                            items=items,
                            categories=categories)
 
 
+@app.route('/items/suggest')
+def suggest_items():
+    """Suggests items by title prefix."""
+    return jsonify(items=suggest(item_index, db.Item))
+
+
 @app.route('/items/<int:item_id>')
 @app.route('/categories/<int:category_id>/items/<int:item_id>')
 @app.route('/items/<int:item_id>.<format>')
@@ -241,27 +366,20 @@ def new_item(category_id=None):
     _, Session = db.get(app, g)
     sess = Session()
 
-    # Fetch all categories
-    categories = sess.query(db.Category).order_by(db.Category.title).all()
-
-    # Calculate item category ids
-    item_category_ids = set()
+    # Fetch category for prefix
     category = None
     if category_id:
-        item_category_ids.add(category_id)
-        for cat in categories:
-            if cat.id == category_id:
-                category = g.category = cat
-                break
+        query = sess.query(db.Category).filter(db.Category.id == category_id)
+        category = query.first()
 
     # Configure url_for to add category prefix
     g.category = category
 
+    # Other categories are loaded on demand by the form
     return render_template('items/edit.html',
                            item=None,
                            category=category,
-                           categories=categories,
-                           item_category_ids=item_category_ids)
+                           categories=[category] if category else [])
 
 
 @app.route('/items/<int:item_id>/edit')
@@ -277,15 +395,13 @@ def edit_item(item_id, category_id=None):
 
     # Fetch item
     query = sess.query(db.Item).filter(db.Item.id == item_id)
-    item = query.options(db.item_with_category_association).first()
+    item = query.options(db.item_with_categories).first()
     if not item:
         return page_not_found()
 
-    # Fetch all categories
-    categories = sess.query(db.Category).order_by(db.Category.title).all()
-
-    # Calculate item category ids
-    item_category_ids = set(a.category_id for a in item.categories)
+    # Fetch item categories; others are loaded on demand by the form
+    categories = sorted((a.category for a in item.categories),
+                        key=lambda c: c.title)
 
     # Find item category
     category = None
@@ -301,7 +417,6 @@ def edit_item(item_id, category_id=None):
 
     return render_template('items/edit.html',
                            item=item,
-                           item_category_ids=item_category_ids,
                            categories=categories,
                            category=category)
 
@@ -319,19 +434,21 @@ def create_item(category_id=None):
         if key != 'categories':
             setattr(item, key, value)
 
+    # Create database session
+    _, Session = db.get(app, g)
+    sess = Session()
+
     # Create item categories
-    for category_id in request.form.getlist('categories'):
+    category_ids = request.form.getlist('categories')
+    for category_id in existing_category_ids(sess, category_ids):
         assoc = db.CategoryItemAssociation()
         assoc.category_id = category_id
         item.categories.append(assoc)
 
-    # Create database session
-    _, Session = db.get(app, g)
-    sess = Session()
-
     # Persist item
     sess.add(item)
     sess.commit()
+    item_index.put(item.id, item.title)
 
     return redirect(url_for('view_item',
                             item_id=item.id,
@@ -373,7 +490,7 @@ def update_item(item_id, category_id=None):
         for association in tuple(item.categories):
             sess.delete(association)
     else:
-        new_categories = set(map(int, new_categories))
+        new_categories = existing_category_ids(sess, new_categories)
         old_categories = set(a.category_id for a in item.categories)
 
         # Delete removed associations
@@ -391,6 +508,7 @@ def update_item(item_id, category_id=None):
 
     # Persist item
     sess.commit()
+    item_index.put(item.id, item.title)
 
     return redirect(url_for('view_item',
                             item_id=item_id,
@@ -412,6 +530,7 @@ def delete_item(item_id, category_id=None):
     # Delete item
     sess.query(db.Item).filter(db.Item.id == item_id).delete()
     sess.commit()
+    item_index.remove(item_id)
 
     if category_id:
         return redirect(url_for('view_category', category_id=category_id))
@@ -429,16 +548,85 @@ def view_category(category_id):
 
     # Fetch category
     query = session.query(db.Category).filter(db.Category.id == category_id)
-    category = query.options(db.category_with_items).first()
+    category = query.first()
     if not category:
         return page_not_found()
 
+    # Fetch category items
+    items = session.query(db.Item).options(db.item_with_categories)
+    items = items.join(db.CategoryItemAssociation,
+                       db.CategoryItemAssociation.item_id == db.Item.id)
+    items = items.filter(
+        db.CategoryItemAssociation.category_id == category.id)
+    items = items.order_by(desc(db.Item.updated_at))
+
     # Configure url_for to add category prefix
     g.category = category
 
-    return render_template('items/list.html',
+    # Items are queried while the page streams, after the head is sent
+    return stream_template('items/list.html',
                            category=category,
-                           items=[a.item for a in category.items if a.item])
+                           items=items)
+
+
+@app.route('/categories/<int:category_id>/reassign', methods=['POST'])
+@app.route('/categories/<int:category_id>/reassign.<format>',
+           methods=['POST'])
+def reassign_category(category_id, format=None):
+    """Copies, moves or merges the items of a category into another."""
+    if not session.get('user_id'):
+        return unauthorized()
+
+    mode = request.form.get('mode', 'move').lower()
+    target_id = request.form.get('target', type=int)
+    if mode not in db.REASSIGN_MODES or target_id in (None, category_id):
+        return bad_request('Invalid reassignment.')
+
+    # Restrict to the given items, rejecting malformed IDs rather than
+    # widening the reassignment to the whole category
+    item_ids = None
+    if 'items' in request.form:
+        item_ids = request.form.getlist('items', type=int)
+        if len(item_ids) != len(request.form.getlist('items')):
+            return bad_request('Invalid reassignment.')
+    if mode == 'merge' and item_ids is not None:
+        return bad_request('Merging always reassigns every item.')
+
+    # Create database session
+    _, Session = db.get(app, g)
+    sess = Session()
+
+    # Ensure both categories exist
+    query = sess.query(db.Category.id)
+    query = query.filter(db.Category.id.in_([category_id, target_id]))
+    if query.count() != 2:
+        return page_not_found()
+
+    # Reassign items, retrying once if a concurrent edit added one of the
+    # items to the target category after the duplicate check
+    for attempt in range(2):
+        try:
+            added = db.reassign_items(sess, category_id, target_id,
+                                      mode=mode, item_ids=item_ids)
+            break
+        except IntegrityError:
+            if attempt:
+                return conflict('Categories changed during reassignment.')
+    if mode == 'merge':
+        category_index.remove(category_id)
+
+    # Return in JSON format
+    if format == 'json':
+        return jsonify(source_id=category_id, target_id=target_id,
+                       mode=mode, added=added)
+
+    return redirect(url_for('view_category', category_id=target_id))
+
+
+@app.route('/categories/suggest')
+def suggest_categories():
+    """Suggests categories by title prefix."""
+    return jsonify(categories=suggest(category_index, db.Category))
 
 
 @app.route('/categories/new')
@@ -489,6 +677,7 @@ def create_category():
     # Persist category
     sess.add(category)
     sess.commit()
+    category_index.put(category.id, category.title)
 
     return redirect(url_for('view_category', category_id=category.id))
 
@@ -519,6 +708,7 @@ def update_category(category_id):
         setattr(category, key, value)
 
     sess.commit()
+    category_index.put(category.id, category.title)
 
     return redirect(url_for('view_category', category_id=category_id))
 
@@ -534,6 +724,7 @@ def delete_category(category_id):
     # Delete category
     sess.query(db.Category).filter(db.Category.id == category_id).delete()
     sess.commit()
+    category_index.remove(category_id)
 
     return redirect(url_for('index'))
 
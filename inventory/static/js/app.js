@@ -1 +1,59 @@
 $(document).foundation()
+
+// Load category suggestions on demand for the item form
+$('[data-suggest-url]').each(function () {
+  var $input = $(this)
+  var $choices = $($input.data('suggest-choices'))
+  var $suggestions = $input.next('.category-suggestions')
+  var timer = null
+
+  function addChoice (category) {
+    var $existing = $choices.find('input[value="' + category.id + '"]')
+    if ($existing.length) {
+      $existing.prop('checked', true)
+      return
+    }
+    var $checkbox = $('<input type="checkbox" name="categories" checked>')
+      .val(category.id)
+    $('<label>').append($checkbox, ' ', document.createTextNode(category.title))
+      .appendTo($choices)
+  }
+
+  function showSuggestions (categories) {
+    $suggestions.empty()
+    $.each(categories, function (_, category) {
+      $('<a href="#">').text(category.title)
+        .on('click', function (event) {
+          event.preventDefault()
+          addChoice(category)
+          $suggestions.empty()
+          $input.val('').focus()
+        })
+        .appendTo($('<li>').appendTo($suggestions))
+    })
+  }
+
+  $input.on('input', function () {
+    clearTimeout(timer)
+    var prefix = $.trim($input.val())
+    if (!prefix) {
+      $suggestions.empty()
+      return
+    }
+    timer = setTimeout(function () {
+      $.getJSON($input.data('suggest-url'), {prefix: prefix}, function (data) {
+        if ($.trim($input.val()) === prefix) {
+          showSuggestions(data.categories)
+        }
+      })
+    }, 150)
+  })
+
+  // Pick the first suggestion instead of submitting the form
+  $input.on('keydown', function (event) {
+    if (event.which === 13) {
+      event.preventDefault()
+      $suggestions.find('a').first().click()
+    }
+  })
+})
@@ -0,0 +1,106 @@
+from bisect import bisect_left, insort
+from threading import Lock
+from time import monotonic
+
+
+class PrefixIndex(object):
+    """In-memory sorted index of titles for prefix lookups.
+
+    Entries are kept in a list sorted by case-folded title, so a lookup is a
+    binary search followed by a short scan over the matching range.
+
+    Attributes:
+        loaded: Whether the index was loaded from the database.
+        loaded_at: The monotonic time of the last load.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.loaded_at = None
+        self._keys = []
+        self._titles = {}
+        self._pending = None
+        self._lock = Lock()
+        self._load_lock = Lock()
+
+    @staticmethod
+    def _key(id, title):
+        return (title.casefold(), id)
+
+    def load(self, fetch):
+        """Replaces the index contents with freshly fetched rows.
+
+        Writes made while the rows are fetched are recorded and replayed
+        afterwards, so they are not lost to an older snapshot.
+
+        Args:
+            fetch: A callable returning an iterable of (id, title) rows.
+        """
+        with self._load_lock:
+            with self._lock:
+                self._pending = []
+            try:
+                titles = {id: title for id, title in fetch() if title}
+            except Exception:
+                with self._lock:
+                    self._pending = None
+                raise
+            keys = sorted(self._key(id, title)
+                          for id, title in titles.items())
+            with self._lock:
+                pending, self._pending = self._pending, None
+                self._keys = keys
+                self._titles = titles
+                for id, title in pending:
+                    self._put(id, title)
+                self.loaded = True
+                self.loaded_at = monotonic()
+
+    def is_stale(self, max_age):
+        """Returns whether the index is unloaded or older than max_age."""
+        return not self.loaded or monotonic() - self.loaded_at > max_age
+
+    def put(self, id, title):
+        """Adds or updates the title of an entry."""
+        with self._lock:
+            self._put(id, title)
+            if self._pending is not None:
+                self._pending.append((id, title))
+
+    def remove(self, id):
+        """Removes an entry if present."""
+        self.put(id, None)
+
+    def _put(self, id, title):
+        self._discard(id)
+        if title:
+            self._titles[id] = title
+            insort(self._keys, self._key(id, title))
+
+    def _discard(self, id):
+        title = self._titles.pop(id, None)
+        if title is not None:
+            key = self._key(id, title)
+            pos = bisect_left(self._keys, key)
+            if pos < len(self._keys) and self._keys[pos] == key:
+                del self._keys[pos]
+
+    def search(self, prefix, limit=10):
+        """Finds entries whose title starts with a prefix.
+
+        Args:
+            prefix: The case-insensitive title prefix.
+            limit: The maximum number of entries to return.
+
+        Returns:
+            A list of (id, title) tuples ordered by title.
+        """
+        prefix = prefix.casefold()
+        results = []
+        with self._lock:
+            pos = bisect_left(self._keys, (prefix,))
+            for folded, id in self._keys[pos:pos + limit]:
+                if not folded.startswith(prefix):
+                    break
+                results.append((id, self._titles[id]))
+        return results
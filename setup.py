@@ -9,6 +9,9 @@ setup(
         'oauth2client~=4.1.0',
         'pyyaml~=3.12',
     ],
+    extras_require={
+        'brotli': ['brotli'],
+    },
     package_data={'inventory': [
         'sample_data.yaml',
         'static/*.*',